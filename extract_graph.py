@@ -1,25 +1,98 @@
 import json
-import sys
 import csv
+import io
 import ifcopenshell
 import networkx as nx
-import math
+import numpy as np
+import pandas as pd
+import multiprocessing
 import os
 
+try:
+    import orjson
+except ImportError:  # optional: falls back to stdlib json
+    orjson = None
 
+# Node types kept in the graph but never given a bbox: the derived spatial
+# relations skip them, and shape extraction is the most expensive step per node.
+NO_BBOX_TYPES = ("IfcSpace", "IfcBuildingStorey", "IfcSystem")
 
-def node_id(ent):
+# Set once ifcopenshell.geom fails to import, so later nodes skip the attempt.
+_GEOM_DISABLED = False
+
+
+def entity_meta(ent, meta=None):
+    """
+    (ifc_type, GlobalId, Name) of an entity. Each of these is a call into
+    ifcopenshell, so callers pass a `meta` dict to memoise them per entity
+    (keyed by STEP id: the Python wrapper objects are not persistent).
+    """
+    if meta is None:
+        return ent.is_a(), getattr(ent, "GlobalId", None), getattr(ent, "Name", None)
+    key = ent.id()
+    m = meta.get(key)
+    if m is None:
+        m = meta[key] = (ent.is_a(), getattr(ent, "GlobalId", None), getattr(ent, "Name", None))
+    return m
+
+def node_id(ent, meta=None):
     # Stable id for graph nodes
-    return f"{ent.is_a()}_{ent.GlobalId}" if hasattr(ent, "GlobalId") else f"{ent.is_a()}_{id(ent)}"
+    ifc_type, gid, _ = entity_meta(ent, meta)
+    return f"{ifc_type}_{gid}" if gid is not None else f"{ifc_type}_{id(ent)}"
+
+class NodeGeometry:
+    """
+    Per-node bbox/centroid as parallel float64 arrays (N x 6, N x 3) indexed
+    by an integer row per node id, instead of tuples stored in every
+    G.nodes[n] dict. The derived-relations pass and the exports slice these
+    arrays directly. Rows without geometry are NaN.
+    """
+
+    def __init__(self, capacity=1024):
+        self.row = {}  # node id -> row
+        self.bbox = np.full((capacity, 6), np.nan, dtype=np.float64)
+        self.centroid = np.full((capacity, 3), np.nan, dtype=np.float64)
 
-def add_node(G, model, ent):
-    nid = node_id(ent)
+    @classmethod
+    def from_graph(cls, G: nx.MultiDiGraph):
+        """Geometry of a graph that still carries bbox/centroid node attrs."""
+        geom = cls(max(G.number_of_nodes(), 1))
+        for nid, attrs in G.nodes(data=True):
+            geom.add(nid, attrs.get("bbox"), attrs.get("centroid"))
+        return geom
+
+    def add(self, nid, bbox, centroid):
+        i = self.row.setdefault(nid, len(self.row))
+        if i == len(self.bbox):  # full: double the capacity
+            self.bbox = np.vstack([self.bbox, np.full_like(self.bbox, np.nan)])
+            self.centroid = np.vstack([self.centroid, np.full_like(self.centroid, np.nan)])
+        if bbox is not None:
+            self.bbox[i] = bbox
+            self.centroid[i] = centroid
+        return i
+
+    def rows(self, nids):
+        return np.fromiter((self.row[n] for n in nids), dtype=np.intp, count=len(nids))
+
+    def has_bbox(self, nid):
+        i = self.row.get(nid)
+        return i is not None and not np.isnan(self.bbox[i, 0])
+
+    def get(self, nid):
+        """(bbox, centroid) as float tuples, or (None, None)."""
+        if not self.has_bbox(nid):
+            return None, None
+        i = self.row[nid]
+        return tuple(self.bbox[i].tolist()), tuple(self.centroid[i].tolist())
+
+def add_node(G, model, ent, meta=None, bboxes=None, geom=None):
+    if meta is None:
+        meta = {}  # still read the entity only once for node_id and below
+    nid = node_id(ent, meta)
+    ifc_type, gid, name = entity_meta(ent, meta)
     if nid in G:
         return nid
 
-    ifc_type = ent.is_a()
-    name = getattr(ent, "Name", None)
-
     # ---------------------------
     # OPTION B (Controlled graph / allowlist)
     # Keep:
@@ -50,16 +123,26 @@ def add_node(G, model, ent):
         except Exception:
             return None
 
-    # Geometry-lite features (bbox/centroid)
-    bbox, centroid = try_get_bbox_centroid(model, ent)
+    # Geometry-lite features (bbox/centroid), only for nodes that can take part
+    # in the derived relations. From the compute_bboxes pre-pass when available.
+    if ifc_type in NO_BBOX_TYPES:
+        bbox, centroid = None, None
+    elif bboxes is not None:
+        bbox, centroid = bboxes.get(gid, (None, None))
+    else:
+        bbox, centroid = try_get_bbox_centroid(model, ent)
 
-    G.add_node(
-        nid,
-        ifc_type=ifc_type,
-        name=name,
-        bbox=bbox,
-        centroid=centroid,
-    )
+    if geom is not None:
+        G.add_node(nid, ifc_type=ifc_type, name=name)
+        geom.add(nid, bbox, centroid)
+    else:
+        G.add_node(
+            nid,
+            ifc_type=ifc_type,
+            name=name,
+            bbox=bbox,
+            centroid=centroid,
+        )
     return nid
 
 def safe_by_type(model, type_name):
@@ -68,6 +151,61 @@ def safe_by_type(model, type_name):
     except RuntimeError:
         return []
 
+def bbox_from_geometry(geometry):
+    """
+    (bbox, centroid) from a triangulated shape geometry, or (None, None) if it
+    has fewer than two vertices.
+    Reads the raw float64 vertex buffer when ifcopenshell exposes it (no
+    per-vertex Python floats) and reduces it with NumPy.
+    """
+    buf = getattr(geometry, "verts_buffer", None)
+    if buf is not None:
+        verts = np.frombuffer(buf, dtype=np.float64)
+    else:
+        verts = np.asarray(geometry.verts, dtype=np.float64)  # flat [x1,y1,z1,x2,y2,z2,...]
+    if verts.size < 6:
+        return None, None
+
+    verts = verts.reshape(-1, 3)
+    mn = verts.min(axis=0)
+    mx = verts.max(axis=0)
+    centroid = (mn + mx) * 0.5
+
+    return (*mn.tolist(), *mx.tolist()), tuple(centroid.tolist())
+
+def compute_bboxes(model):
+    """
+    Geometry pre-pass: walk the whole model once with ifcopenshell.geom.iterator
+    (C++ thread pool, one thread per core) and return {GlobalId: (bbox, centroid)}
+    for every product that has a shape.
+    Returns None if the geometry backend is unavailable or the iterator fails;
+    add_node then falls back to try_get_bbox_centroid per entity.
+    """
+    global _GEOM_DISABLED
+    try:
+        import ifcopenshell.geom
+    except Exception:
+        _GEOM_DISABLED = True
+        return None
+
+    bboxes = {}
+    try:
+        settings = ifcopenshell.geom.settings()
+        settings.set(settings.USE_WORLD_COORDS, True)
+
+        it = ifcopenshell.geom.iterator(settings, model, multiprocessing.cpu_count())
+        if it.initialize():
+            while True:
+                shape = it.get()
+                bbox, centroid = bbox_from_geometry(shape.geometry)
+                if bbox is not None:
+                    bboxes[shape.guid] = (bbox, centroid)
+                if not it.next():
+                    break
+    except Exception:
+        return None
+    return bboxes
+
 def try_get_bbox_centroid(model, ent):
     """
     Returns (bbox, centroid) where:
@@ -75,9 +213,13 @@ def try_get_bbox_centroid(model, ent):
       centroid = (cx, cy, cz)
     If geometry backend is unavailable or element has no shape, returns (None, None).
     """
+    global _GEOM_DISABLED
+    if _GEOM_DISABLED:
+        return None, None
     try:
         import ifcopenshell.geom
     except Exception:
+        _GEOM_DISABLED = True
         return None, None
 
     try:
@@ -85,44 +227,161 @@ def try_get_bbox_centroid(model, ent):
         settings.set(settings.USE_WORLD_COORDS, True)
 
         shape = ifcopenshell.geom.create_shape(settings, ent)
-        verts = shape.geometry.verts  # flat list [x1,y1,z1,x2,y2,z2,...]
-        if not verts or len(verts) < 6:
-            return None, None
+        return bbox_from_geometry(shape.geometry)
+    except Exception:
+        return None, None
 
-        xs = verts[0::3]
-        ys = verts[1::3]
-        zs = verts[2::3]
 
-        minx, maxx = min(xs), max(xs)
-        miny, maxy = min(ys), max(ys)
-        minz, maxz = min(zs), max(zs)
+def bbox_pair_relations(B, adj_eps, z_gap_min, z_gap_max, block=256):
+    """
+    Spatial relations over the pairs i < j of an (n, 6) bbox array of
+    (minx, miny, minz, maxx, maxy, maxz):
+      - adjacent: Euclidean gap between the two boxes <= adj_eps (0 if they
+        overlap or touch)
+      - a_above_b: xy footprints overlap (touching counts) and
+        z_gap_min <= a.minz - b.maxz <= z_gap_max; b_above_a likewise
+
+    Boxes are sorted by minx and swept: b can only touch or overlap a if
+    b.minx <= a.maxx + adj_eps, so each row block is only tested against the
+    columns within reach instead of the whole group.
+
+    Yields (i, j, adjacent, a_above_b, b_above_a) for pairs where at least one
+    relation holds, ordered by (i, j) like the nested loop it replaces.
+    """
+    n = len(B)
+    order = np.argsort(B[:, 0], kind="stable")
+    S = B[order]
+    reach = np.searchsorted(S[:, 0], S[:, 3] + max(adj_eps, 0.0), side="right")
+
+    found = []
+    for r0 in range(0, n, block):
+        r1 = min(r0 + block, n)
+        c1 = int(reach[r0:r1].max())
+        if c1 <= r0 + 1:
+            continue
+        A = S[r0:r1, None, :]   # rows (a)
+        C = S[None, r0:c1, :]   # candidate columns (b)
 
-        cx = (minx + maxx) / 2.0
-        cy = (miny + maxy) / 2.0
-        cz = (minz + maxz) / 2.0
+        dx = np.maximum(0.0, np.maximum(A[..., 0] - C[..., 3], C[..., 0] - A[..., 3]))
+        dy = np.maximum(0.0, np.maximum(A[..., 1] - C[..., 4], C[..., 1] - A[..., 4]))
+        dz = np.maximum(0.0, np.maximum(A[..., 2] - C[..., 5], C[..., 2] - A[..., 5]))
+        adj = np.sqrt(dx*dx + dy*dy + dz*dz) <= adj_eps
 
-        return (minx, miny, minz, maxx, maxy, maxz), (cx, cy, cz)
-    except Exception:
-        return None, None
+        ov = ((A[..., 0] <= C[..., 3]) & (A[..., 3] >= C[..., 0]) &
+              (A[..., 1] <= C[..., 4]) & (A[..., 4] >= C[..., 1]))
+        gap_ab = A[..., 2] - C[..., 5]  # a.minz - b.maxz
+        gap_ba = C[..., 2] - A[..., 5]
+        ab = ov & (gap_ab >= z_gap_min) & (gap_ab <= z_gap_max)
+        ba = ov & (gap_ba >= z_gap_min) & (gap_ba <= z_gap_max)
+
+        # keep strict upper triangle (j > i) in sorted order
+        upper = np.triu(np.ones((r1 - r0, c1 - r0), dtype=bool), k=1)
+        ii, jj = np.nonzero((adj | ab | ba) & upper)
+        found.append((r0 + ii, r0 + jj, adj[ii, jj], ab[ii, jj], ba[ii, jj]))
+
+    if not found:
+        return
+    si, sj, adj, ab, ba = (np.concatenate(c) for c in zip(*found))
+
+    # back to original indices, oriented so that i < j
+    p, q = order[si], order[sj]
+    swap = p > q
+    i = np.where(swap, q, p)
+    j = np.where(swap, p, q)
+    ab, ba = np.where(swap, ba, ab), np.where(swap, ab, ba)
+
+    for k in np.lexsort((j, i)).tolist():
+        yield int(i[k]), int(j[k]), bool(adj[k]), bool(ab[k]), bool(ba[k])
+
+
+def _json_bytes(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_record(head: bytes, attrs, tail: bytes = b"") -> bytes:
+    """
+    One JSON object made of `head` (already serialised "key":value pairs),
+    the attrs dict spliced in without copying it, then `tail` (serialised
+    ',"key":value' pairs).
+    """
+    body = _json_bytes(attrs)
+    if len(body) <= 2:  # {}
+        return b"{" + head + tail + b"}"
+    return b"{" + head + b"," + body[1:-1] + tail + b"}"
+
+
+def _geom_attrs(geom, nid):
+    if geom is None:
+        return {}
+    bbox, centroid = geom.get(nid)
+    return {"bbox": bbox, "centroid": centroid}
 
 
-def bbox_xy_overlap(a, b):
-    # a,b: (minx,miny,minz,maxx,maxy,maxz)
-    return (a[0] <= b[3] and a[3] >= b[0]) and (a[1] <= b[4] and a[4] >= b[1])
+def write_graph_json_pretty(G: nx.MultiDiGraph, schema, out_json="graph.json", geom=None):
+    """
+    Human-readable graph.json (indent=2). Builds the whole document in memory
+    and roughly doubles the file size, so it is opt-in (--pretty).
+    Returns (num_nodes, num_edges).
+    """
+    data = {
+        "schema": schema,
+        "num_nodes": G.number_of_nodes(),
+        "num_edges": G.number_of_edges(),
+        "nodes": [{"id": n, **attrs, **_geom_attrs(geom, n)} for n, attrs in G.nodes(data=True)],
+        "edges": [{"src": u, "dst": v, **attrs} for u, v, attrs in G.edges(data=True)],
+    }
+    if orjson is not None:
+        with open(out_json, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(out_json, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return data["num_nodes"], data["num_edges"]
 
 
-def bbox_min_distance(a, b):
+def write_graph_json(G: nx.MultiDiGraph, schema, out_json="graph.json", pretty=False, geom=None):
     """
-    Minimum Euclidean distance between two axis-aligned bounding boxes.
-    0 if they overlap/touch.
+    Stream compact graph.json, one node/edge record per line, so the full
+    document is never held in memory next to the graph itself. Nodes and edges
+    are walked once each and counted on the way; num_nodes/num_edges close
+    the document. Uses orjson when installed, stdlib json otherwise.
+    pretty=True writes the indented form instead (write_graph_json_pretty).
+    If geom is given, each node's bbox/centroid are read from it.
+    Returns (num_nodes, num_edges).
     """
-    dx = max(0.0, max(a[0] - b[3], b[0] - a[3]))
-    dy = max(0.0, max(a[1] - b[4], b[1] - a[4]))
-    dz = max(0.0, max(a[2] - b[5], b[2] - a[5]))
-    return math.sqrt(dx*dx + dy*dy + dz*dz)
+    if pretty:
+        return write_graph_json_pretty(G, schema, out_json, geom=geom)
+
+    num_nodes = num_edges = 0
+
+    with open(out_json, "wb") as f:
+        f.write(b'{"schema":' + _json_bytes(schema) + b',\n"nodes":[')
+        sep = b"\n"
+        for n, attrs in G.nodes(data=True):
+            tail = b""
+            if geom is not None:
+                bbox, centroid = geom.get(n)
+                tail = b',"bbox":' + _json_bytes(bbox) + b',"centroid":' + _json_bytes(centroid)
+            f.write(sep + _json_record(b'"id":' + _json_bytes(n), attrs, tail))
+            sep = b",\n"
+            num_nodes += 1
+
+        f.write(b'\n],\n"edges":[')
+        sep = b"\n"
+        for u, v, attrs in G.edges(data=True):
+            f.write(sep + _json_record(b'"src":' + _json_bytes(u) + b',"dst":' + _json_bytes(v), attrs))
+            sep = b",\n"
+            num_edges += 1
 
+        f.write(b'\n],\n"num_nodes":' + _json_bytes(num_nodes) +
+                b',"num_edges":' + _json_bytes(num_edges) + b"}\n")
 
-def export_csv_nodes_edges(G: nx.MultiDiGraph, nodes_csv="nodes.csv", edges_csv="edges.csv"):
+    return num_nodes, num_edges
+
+
+def export_csv_nodes_edges(G: nx.MultiDiGraph, nodes_csv="nodes.csv", edges_csv="edges.csv", geom=None):
     # Assign integer indices for ML (edge_index style)
     nodes = list(G.nodes())
     idx_map = {nid: i for i, nid in enumerate(nodes)}
@@ -134,91 +393,172 @@ def export_csv_nodes_edges(G: nx.MultiDiGraph, nodes_csv="nodes.csv", edges_csv=
     edge_types = sorted({attrs.get("rel") for _, _, attrs in G.edges(data=True) if attrs.get("rel")})
     edge_type_to_id = {t: i for i, t in enumerate(edge_types)}
 
-    # nodes.csv
-    with open(nodes_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow([
-            "idx", "node_id", "ifc_type", "node_type_id", "name",
-            "cx", "cy", "cz",
-            "minx", "miny", "minz", "maxx", "maxy", "maxz"
-        ])
-        for nid in nodes:
-            attrs = G.nodes[nid]
-            t = attrs.get("ifc_type")
-
-            cent = attrs.get("centroid")
-            bbox = attrs.get("bbox")
-
-            if cent:
-                cx, cy, cz = cent
-            else:
-                cx = cy = cz = ""
-
-            if bbox:
-                minx, miny, minz, maxx, maxy, maxz = bbox
-            else:
-                minx = miny = minz = maxx = maxy = maxz = ""
-
-            w.writerow([
-                idx_map[nid], nid, t, node_type_to_id.get(t, -1), attrs.get("name"),
-                cx, cy, cz,
-                minx, miny, minz, maxx, maxy, maxz
-            ])
-
+    # nodes.csv (columnar, written by pandas' C writer; missing geometry -> "")
+    if geom is None:
+        geom = NodeGeometry.from_graph(G)
+    attrs = [G.nodes[nid] for nid in nodes]
+    types = [a.get("ifc_type") for a in attrs]
+    rows = geom.rows(nodes)
+    cent = geom.centroid[rows]
+    bbox = geom.bbox[rows]
+
+    pd.DataFrame({
+        "idx": np.arange(len(nodes)),
+        "node_id": nodes,
+        "ifc_type": types,
+        "node_type_id": [node_type_to_id.get(t, -1) for t in types],
+        "name": [a.get("name") for a in attrs],
+        "cx": cent[:, 0], "cy": cent[:, 1], "cz": cent[:, 2],
+        "minx": bbox[:, 0], "miny": bbox[:, 1], "minz": bbox[:, 2],
+        "maxx": bbox[:, 3], "maxy": bbox[:, 4], "maxz": bbox[:, 5],
+    }).to_csv(nodes_csv, index=False, lineterminator="\r\n")
 
     # edges.csv
-    with open(edges_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["src", "dst", "rel", "edge_type_id", "src_idx", "dst_idx"])
-        for u, v, attrs in G.edges(data=True):
-            rel = attrs.get("rel")
-            w.writerow([u, v, rel, edge_type_to_id.get(rel, -1), idx_map[u], idx_map[v]])
+    src = [u for u, _ in G.edges()]
+    dst = [v for _, v in G.edges()]
+    rels = [r for _, _, r in G.edges(data="rel")]
+
+    pd.DataFrame({
+        "src": src,
+        "dst": dst,
+        "rel": rels,
+        "edge_type_id": [edge_type_to_id.get(r, -1) for r in rels],
+        "src_idx": [idx_map[u] for u in src],
+        "dst_idx": [idx_map[v] for v in dst],
+    }).to_csv(edges_csv, index=False, lineterminator="\r\n")
 
     # (Optional) return mappings too, useful later
     return idx_map, node_type_to_id, edge_type_to_id
 
-def export_facts(G: nx.MultiDiGraph, facts_tsv="facts.tsv"):
+def export_npz(G: nx.MultiDiGraph, idx_map, node_type_to_id, edge_type_to_id, npz_path="graph.npz", geom=None):
     """
-    Reasoning-ready export as triples:
-      subject \t predicate \t object
-    We export:
+    Compact binary export for ML loaders (np.load + torch.from_numpy, no parsing):
+      node_id, node_type (int32), bbox (float32, N x 6), centroid (float32, N x 3)
+      src, dst, rel (int32 edge index + edge_type_id)
+      node_type_names / edge_type_names to decode the ids
+    Missing geometry is NaN; unknown types are -1 (same as the CSVs).
+    """
+    if geom is None:
+        geom = NodeGeometry.from_graph(G)
+    nodes = list(idx_map)
+
+    node_type = np.fromiter(
+        (node_type_to_id.get(t, -1) for t in (G.nodes[nid].get("ifc_type") for nid in nodes)),
+        dtype=np.int32, count=len(nodes),
+    )
+    rows = geom.rows(nodes)
+    bbox = geom.bbox[rows].astype(np.float32)
+    centroid = geom.centroid[rows].astype(np.float32)
+
+    m = G.number_of_edges()
+    src = np.fromiter((idx_map[u] for u, _ in G.edges()), dtype=np.int32, count=m)
+    dst = np.fromiter((idx_map[v] for _, v in G.edges()), dtype=np.int32, count=m)
+    rel = np.fromiter((edge_type_to_id.get(r, -1) for _, _, r in G.edges(data="rel")), dtype=np.int32, count=m)
+
+    np.savez_compressed(
+        npz_path,
+        node_id=np.array(nodes, dtype=str),
+        node_type=node_type,
+        bbox=bbox,
+        centroid=centroid,
+        src=src,
+        dst=dst,
+        rel=rel,
+        node_type_names=np.array(sorted(node_type_to_id, key=node_type_to_id.get), dtype=str),
+        edge_type_names=np.array(sorted(edge_type_to_id, key=edge_type_to_id.get), dtype=str),
+    )
+
+def collect_facts(G: nx.MultiDiGraph):
+    """
+    Reasoning-ready triples as three parallel lists (subjects, predicates, objects):
       - has_type(node, IfcWall)
       - has_name(node, "Wall A") (if exists)
       - rel edges as predicates: contained_in, part_of, connects (lowercased)
     """
-    def norm_pred(p: str) -> str:
-        return p.strip().lower()
+    S, P, O = [], [], []
 
-    with open(facts_tsv, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f, delimiter="\t")
-        w.writerow(["subject", "predicate", "object"])
+    # Node facts
+    for nid, attrs in G.nodes(data=True):
+        ifc_type = attrs.get("ifc_type")
+        if ifc_type:
+            S.append(nid); P.append("has_type"); O.append(ifc_type)
+        name = attrs.get("name")
+        if name:
+            S.append(nid); P.append("has_name"); O.append(str(name))
+
+    # Edge facts
+    preds = {}  # rel -> normalised predicate (a handful of distinct values)
+    for u, v, rel in G.edges(data="rel"):
+        if not rel:
+            continue
 
-        # Node facts
-        for nid, attrs in G.nodes(data=True):
-            ifc_type = attrs.get("ifc_type")
-            if ifc_type:
-                w.writerow([nid, "has_type", ifc_type])
-            name = attrs.get("name")
-            if name:
-                w.writerow([nid, "has_name", str(name)])
-
-        # Edge facts
-        for u, v, attrs in G.edges(data=True):
-            rel = attrs.get("rel")
-            if not rel:
-                continue
+        pred = preds.get(rel)
+        if pred is None:
+            pred = preds[rel] = rel.strip().lower()
+        S.append(u); P.append(pred); O.append(v)
+
+        # --- NEW: derived fact for construction reasoning ---
+        # in_storey(x, storey) if contained_in(x, storey) AND storey is IfcBuildingStorey
+        if pred == "contained_in" and G.nodes[v].get("ifc_type") == "IfcBuildingStorey":
+            S.append(u); P.append("in_storey"); O.append(v)
+
+    return S, P, O
 
-            pred = norm_pred(rel)
-            w.writerow([u, pred, v])
+def _write_tsv_rows(f, S, P, O, chunk=8192):
+    """
+    Write (S[i], P[i], O[i]) rows to a binary file as tab-separated lines,
+    joined into one buffer per `chunk` rows. Output matches csv.writer with
+    delimiter="\t": ids and predicates never need quoting, and the rare chunk
+    holding a field with a tab, quote or line break is handed to csv.writer.
+    """
+    for k in range(0, len(S), chunk):
+        rows = list(zip(S[k:k + chunk], P[k:k + chunk], O[k:k + chunk]))
+        buf = "".join([f"{s}\t{p}\t{o}\r\n" for s, p, o in rows])
+
+        n = len(rows)
+        if buf.count("\t") != 2 * n or buf.count("\n") != n or buf.count("\r") != n or '"' in buf:
+            out = io.StringIO()
+            csv.writer(out, delimiter="\t").writerows(rows)
+            buf = out.getvalue()
+
+        f.write(buf.encode("utf-8"))
 
-            # --- NEW: derived fact for construction reasoning ---
-            # in_storey(x, storey) if contained_in(x, storey) AND storey is IfcBuildingStorey
-            v_type = G.nodes[v].get("ifc_type")
-            if pred == "contained_in" and v_type == "IfcBuildingStorey":
-                w.writerow([u, "in_storey", v])
+def export_facts(G: nx.MultiDiGraph, facts_tsv="facts.tsv", facts_parquet=None):
+    """
+    Reasoning-ready export as triples:
+      subject \t predicate \t object
+    (see collect_facts for the exported predicates)
 
+    If facts_parquet is given, the same triples are also written as Parquet
+    with a dictionary-encoded predicate column (needs pyarrow; skipped with a
+    warning otherwise). Returns the Parquet path if it was written, else None.
+    """
+    S, P, O = collect_facts(G)
 
-def main(ifc_path: str, out_json: str = "graph.json"):
+    with open(facts_tsv, "wb", buffering=1 << 16) as f:
+        f.write(b"subject\tpredicate\tobject\r\n")
+        _write_tsv_rows(f, S, P, O)
+
+    if facts_parquet:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print(f"⚠️  pyarrow not installed, skipping {facts_parquet}")
+            return None
+        else:
+            tbl = pa.table({
+                "subject": pa.array(S, type=pa.string()),
+                "predicate": pa.array(P, type=pa.string()).dictionary_encode(),
+                "object": pa.array(O, type=pa.string()),
+            })
+            pq.write_table(tbl, facts_parquet)
+            return facts_parquet
+
+    return None
+
+
+def main(ifc_path: str, out_json: str = "graph.json", binary: bool = False, pretty: bool = False):
     model = ifcopenshell.open(ifc_path)
     G = nx.MultiDiGraph()
         # Put all outputs next to out_json
@@ -230,6 +570,8 @@ def main(ifc_path: str, out_json: str = "graph.json"):
     nodes_csv = os.path.join(out_dir, "nodes.csv")
     edges_csv = os.path.join(out_dir, "edges.csv")
     facts_tsv = os.path.join(out_dir, "facts.tsv")
+    npz_path = os.path.join(out_dir, "graph.npz")
+    facts_parquet = os.path.join(out_dir, "facts.parquet")
 
     # --- Nodes (robust across schemas incl. IFC4X3) ---
     elements = safe_by_type(model, "IfcElement")
@@ -237,42 +579,55 @@ def main(ifc_path: str, out_json: str = "graph.json"):
     storeys  = safe_by_type(model, "IfcBuildingStorey")
     systems  = safe_by_type(model, "IfcSystem")
 
+    # Geometry in one batched pass (None -> per-entity fallback in add_node)
+    bboxes = compute_bboxes(model)
+
+    # bbox/centroid per node, kept outside the graph as arrays
+    geom = NodeGeometry()
+
+    # (ifc_type, GlobalId, Name) per entity, shared by every add_node below
+    meta = {}
     for ent in elements + spaces + storeys + systems:
-        add_node(G, model, ent)  # add_node already filters if needed
+        add_node(G, model, ent, meta, bboxes, geom)  # add_node already filters if needed
 
 
     # --- Edges: containment (spatial structure) ---
+    # Storey membership (CONTAINED_IN -> IfcBuildingStorey) is recorded here as
+    # edges are added; the derived relations below group by it.
+    in_storey = {}
     for rel in safe_by_type(model, "IfcRelContainedInSpatialStructure"):
         container = getattr(rel, "RelatingStructure", None)
         if not container:
             continue
 
         # --- FILTER 2: keep containment only into Space/Storey ---
-        if container.is_a() not in ("IfcSpace", "IfcBuildingStorey"):
+        container_type = entity_meta(container, meta)[0]
+        if container_type not in ("IfcSpace", "IfcBuildingStorey"):
             continue
 
-        c_id = add_node(G, model, container)
+        c_id = add_node(G, model, container, meta, bboxes, geom)
         if c_id is None:
             continue
 
         for obj in (getattr(rel, "RelatedElements", None) or []):
-            o_id = add_node(G, model, obj)
+            o_id = add_node(G, model, obj, meta, bboxes, geom)
             if o_id is None:
                 continue
             G.add_edge(o_id, c_id, rel="CONTAINED_IN")
-
+            if container_type == "IfcBuildingStorey":
+                in_storey[o_id] = c_id
 
     # --- Edges: aggregates (part-of) ---
     for rel in safe_by_type(model, "IfcRelAggregates"):
         whole = getattr(rel, "RelatingObject", None)
         if not whole:
             continue
-        w_id = add_node(G, model, whole)
+        w_id = add_node(G, model, whole, meta, bboxes, geom)
         if w_id is None:
             continue
 
         for part in (getattr(rel, "RelatedObjects", None) or []):
-            p_id = add_node(G, model, part)
+            p_id = add_node(G, model, part, meta, bboxes, geom)
             if p_id is None:
                 continue
             G.add_edge(p_id, w_id, rel="PART_OF")
@@ -282,8 +637,8 @@ def main(ifc_path: str, out_json: str = "graph.json"):
         a = getattr(rel, "RelatingElement", None)
         b = getattr(rel, "RelatedElement", None)
         if a and b:
-            a_id = add_node(G, model, a)
-            b_id = add_node(G, model, b)
+            a_id = add_node(G, model, a, meta, bboxes, geom)
+            b_id = add_node(G, model, b, meta, bboxes, geom)
             if a_id is None or b_id is None:
                 continue
             G.add_edge(a_id, b_id, rel="CONNECTS")
@@ -296,83 +651,72 @@ def main(ifc_path: str, out_json: str = "graph.json"):
 
     # Collect nodes that have bbox and are physical-ish elements (not spaces)
     bbox_nodes = []
-    for nid, attrs in G.nodes(data=True):
-        if attrs.get("bbox") is None:
+    for nid, t in G.nodes(data="ifc_type"):
+        if not geom.has_bbox(nid):
             continue
-        t = attrs.get("ifc_type")
-        # skip spaces in spatial adjacency (optional)
-        if t in ("IfcSpace", "IfcBuildingStorey"):
+        # skip spaces/storeys/systems in spatial adjacency
+        if t in NO_BBOX_TYPES:
             continue
         bbox_nodes.append(nid)
 
-    # Optionally: restrict comparisons within same storey using your in_storey facts
-    # We'll infer storey membership from CONTAINED_IN edges to IfcBuildingStorey.
-    in_storey = {}
-    for u, v, eattrs in G.edges(data=True):
-        if eattrs.get("rel") == "CONTAINED_IN" and G.nodes[v].get("ifc_type") == "IfcBuildingStorey":
-            in_storey[u] = v
-
+    # Restrict comparisons to the same storey, using in_storey from the
+    # containment loop above.
     # Group by storey to avoid O(n^2) across whole building
     groups = {}
     for nid in bbox_nodes:
         key = in_storey.get(nid, "__NO_STOREY__")
         groups.setdefault(key, []).append(nid)
 
+    # Collected per pair in loop order, then inserted with one add_edges_from
+    derived = []
     for key, group in groups.items():
-        # pairwise within group (OK for now; later can replace by spatial index)
-        for i in range(len(group)):
-            a = group[i]
-            abox = G.nodes[a]["bbox"]
-            for j in range(i + 1, len(group)):
-                b = group[j]
-                bbox = G.nodes[b]["bbox"]
-
-                # ADJACENT if bboxes touch/near
-                d = bbox_min_distance(abox, bbox)
-                if d <= ADJ_EPS:
-                    G.add_edge(a, b, rel="ADJACENT")
-                    G.add_edge(b, a, rel="ADJACENT")
-
-                # ABOVE/BELOW if XY overlap + vertical ordering
-                if bbox_xy_overlap(abox, bbox):
-                    # a above b?
-                    gap_ab = abox[2] - bbox[5]  # a.minz - b.maxz
-                    if Z_GAP_MIN <= gap_ab <= Z_GAP_MAX:
-                        G.add_edge(a, b, rel="ABOVE")
-                        G.add_edge(b, a, rel="BELOW")
-
-                    # b above a?
-                    gap_ba = bbox[2] - abox[5]
-                    if Z_GAP_MIN <= gap_ba <= Z_GAP_MAX:
-                        G.add_edge(b, a, rel="ABOVE")
-                        G.add_edge(a, b, rel="BELOW")
-    
+        B = geom.bbox[geom.rows(group)]
+        for i, j, adjacent, a_above_b, b_above_a in bbox_pair_relations(B, ADJ_EPS, Z_GAP_MIN, Z_GAP_MAX):
+            a, b = group[i], group[j]
+
+            # ADJACENT if bboxes touch/near
+            if adjacent:
+                derived.append((a, b, {"rel": "ADJACENT"}))
+                derived.append((b, a, {"rel": "ADJACENT"}))
+
+            # ABOVE/BELOW if XY overlap + vertical ordering
+            if a_above_b:
+                derived.append((a, b, {"rel": "ABOVE"}))
+                derived.append((b, a, {"rel": "BELOW"}))
+            if b_above_a:
+                derived.append((b, a, {"rel": "ABOVE"}))
+                derived.append((a, b, {"rel": "BELOW"}))
+
+    G.add_edges_from(derived)
+
     # --- Export JSON (single source of truth) ---
-    data = {
-        "schema": getattr(model, "schema", None),
-        "num_nodes": G.number_of_nodes(),
-        "num_edges": G.number_of_edges(),
-        "nodes": [{"id": n, **G.nodes[n]} for n in G.nodes()],
-        "edges": [{"src": u, "dst": v, **attrs} for (u, v, attrs) in G.edges(data=True)],
-    }
-    
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    schema = getattr(model, "schema", None)
+    num_nodes, num_edges = write_graph_json(G, schema, out_json, pretty=pretty, geom=geom)
 
     # --- Dual-output exports ---
-    idx_map, node_type_to_id, edge_type_to_id = export_csv_nodes_edges(G, nodes_csv=nodes_csv, edges_csv=edges_csv)
-    export_facts(G, facts_tsv=facts_tsv)
+    idx_map, node_type_to_id, edge_type_to_id = export_csv_nodes_edges(G, nodes_csv=nodes_csv, edges_csv=edges_csv, geom=geom)
+    wrote_parquet = export_facts(G, facts_tsv=facts_tsv, facts_parquet=facts_parquet if binary else None)
+    if binary:
+        export_npz(G, idx_map, node_type_to_id, edge_type_to_id, npz_path=npz_path, geom=geom)
 
     print(f"✅ Wrote {out_json}")
     print(f"✅ Wrote {nodes_csv} / {edges_csv} (ML-ready indices)")
     print(f"✅ Wrote {facts_tsv} (Reasoning-ready triples)")
-    print(f"   schema={data['schema']}")
-    print(f"   nodes={data['num_nodes']}, edges={data['num_edges']}")
+    if binary:
+        print(f"✅ Wrote {npz_path} (binary arrays)")
+        if wrote_parquet:
+            print(f"✅ Wrote {facts_parquet} (binary triples)")
+    print(f"   schema={schema}")
+    print(f"   nodes={num_nodes}, edges={num_edges}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python extract_graph.py sample.ifc [out.json]")
-        raise SystemExit(2)
-    ifc_path = sys.argv[1]
-    out = sys.argv[2] if len(sys.argv) >= 3 else "graph.json"
-    main(ifc_path, out)
+    import argparse
+
+    ap = argparse.ArgumentParser(description="IFC -> typed graph (Section 1)")
+    ap.add_argument("ifc_path", help="input IFC model, e.g. sample.ifc")
+    ap.add_argument("out_json", nargs="?", default="graph.json", help="graph.json path; other outputs go next to it")
+    ap.add_argument("--binary", action="store_true",
+                    help="also write graph.npz (int32 indices, float32 bbox/centroid) and facts.parquet (needs pyarrow)")
+    ap.add_argument("--pretty", action="store_true", help="indent graph.json for reading (larger, slower)")
+    args = ap.parse_args()
+    main(args.ifc_path, args.out_json, binary=args.binary, pretty=args.pretty)
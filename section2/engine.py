@@ -1,29 +1,196 @@
-from typing import Dict, List, Set, Tuple, Iterable
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Dict, List, NamedTuple, Set, Tuple, Iterable
 import json
+import sys
+
+try:
+    import orjson
+except ImportError:  # optional: append_trace falls back to stdlib json
+    orjson = None
 
 Fact = Tuple[str, str, str]
 
+class Edge(NamedTuple):
+    """One precedence row; fields in precedence_edges.csv column order."""
+    src: str
+    dst: str
+    edge_type: str
+    rule_id: str
+    confidence: float
+    evidence: str
+
+# Predicates with a (predicate, subject) index. Only the trace evidence reads
+# it, and only for in_storey; indexing every predicate would cost a key and a
+# list per fact that nothing looks up.
+_SUBJECT_INDEXED = frozenset({"in_storey"})
+
 class FactBase:
     def __init__(self, facts: Iterable[Fact]):
-        self.facts: Set[Fact] = set(facts)
-        self.by_pred: Dict[str, List[Fact]] = {}
-        for s, p, o in self.facts:
-            self.by_pred.setdefault(p, []).append((s, p, o))
+        # one shared str object per distinct id/predicate/type: the same node id
+        # appears in dozens of facts, and each parsed line brings its own copy
+        self._pool: Dict[str, str] = {}
+        self.facts: Set[Fact] = set()
+        # per-predicate columns (subjects, objects): index builds zip them
+        # straight into dicts/sets instead of unpacking one tuple per fact
+        self.columns: Dict[str, Tuple[List[str], List[str]]] = {}
+        # (pred, subj) -> facts, for the predicates in _SUBJECT_INDEXED only
+        self.by_pred_subj: Dict[Tuple[str, str], List[Fact]] = {}
 
-    def add(self, fact: Fact) -> bool:
-        if fact in self.facts:
-            return False
-        self.facts.add(fact)
+        self.add_many(facts)
+
+    def _intern(self, fact: Fact) -> Fact:
+        pool = self._pool
         s, p, o = fact
-        self.by_pred.setdefault(p, []).append(fact)
-        return True
+        # predicates and IFC type names are a small fixed vocabulary: sys.intern
+        # makes them the same objects as the (already interned) string literals
+        # in the rules, so type/predicate comparisons succeed on identity
+        p = sys.intern(p)
+        if p == "has_type":
+            return (pool.setdefault(s, s), p, sys.intern(o))
+        return (pool.setdefault(s, s), p, pool.setdefault(o, o))
+
+    def add(self, fact: Fact) -> bool:
+        """Add one fact; True if it was new."""
+        return bool(self.add_many((fact,)))
+
+    def add_many(self, facts: Iterable[Fact]) -> List[Fact]:
+        """
+        Add facts not already present; returns the ones that were new, in order.
+        """
+        # Membership stays a plain tuple-set probe: str hashes are cached and
+        # pooled strings compare by identity, so a duplicate costs one lookup.
+        # Lookups are hoisted out of the loop.
+        added: List[Fact] = []
+        seen, intern, columns, by_ps = self.facts, self._intern, self.columns, self.by_pred_subj
+        for fact in facts:
+            if fact in seen:
+                continue
+            fact = intern(fact)
+            seen.add(fact)
+            s, p, o = fact
+            cols = columns.get(p)
+            if cols is None:
+                cols = columns[p] = ([], [])
+            cols[0].append(s)
+            cols[1].append(o)
+            if p in _SUBJECT_INDEXED:
+                bucket = by_ps.get((p, s))
+                if bucket is None:
+                    bucket = by_ps[(p, s)] = []
+                bucket.append(fact)
+            added.append(fact)
+        return added
 
     def get(self, pred: str) -> List[Fact]:
-        return self.by_pred.get(pred, [])
+        cols = self.columns.get(pred)
+        if cols is None:
+            return []
+        subjs, objs = cols
+        return list(zip(subjs, repeat(pred), objs))
+
+    def pairs(self, pred: str):
+        """(subject, object) pairs for pred, zipped from its columns."""
+        cols = self.columns.get(pred)
+        return zip(*cols) if cols is not None else iter(())
+
+    def get_by_subject(self, pred: str, subj: str) -> List[Fact]:
+        """
+        Facts (subj, pred, *) in insertion order. O(1) for the predicates in
+        _SUBJECT_INDEXED; any other predicate falls back to scanning get(pred).
+        """
+        if pred in _SUBJECT_INDEXED:
+            return self.by_pred_subj.get((pred, subj), [])
+        return [f for f in self.get(pred) if f[0] == subj]
 
-def append_trace(trace_path: str, record: dict) -> None:
-    with open(trace_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+# Build-order rank used to orient adjacency: for every adjacency rule the
+# earlier-built type comes first (column < beam < member/slab < wall < door).
+# Unlisted types sort last; ties keep the fact's own order.
+_TYPE_RANK = {
+    "IfcColumn": 0,
+    "IfcBeam": 1,
+    "IfcMember": 2,
+    "IfcSlab": 2,
+    "IfcWall": 3,
+    "IfcWallStandardCase": 3,
+    "IfcDoor": 4,
+}
+_UNRANKED = len(_TYPE_RANK)
+
+@dataclass
+class FactIndex:
+    """
+    Lookups the rules share, built once from the fact base instead of each
+    rule rescanning the facts. Only has_type / in_storey / adjacent / above are
+    indexed; rules derive requires_before / supports, so one index stays valid
+    for a whole rule batch.
+    """
+    type_of: Dict[str, str]
+    storey_of: Dict[str, str]
+    adj: Tuple[Tuple[str, str], ...]  # distinct adjacent pairs, in fact order
+    above_pairs: List[Tuple[str, str]]  # (x, y) for x above y
+    # (type(a), type(b)) -> adjacent (a, b) pairs, each pair oriented by
+    # _TYPE_RANK, so a rule walks only the one bucket per type pair it matches
+    # and never needs the mirrored (b, a) case
+    adj_by_type: Dict[Tuple[str, str], List[Tuple[str, str]]] = field(init=False, repr=False)
+    # (type(x), type(y)) -> distinct (x, y) above pairs, in above_pairs order
+    above_by_type: Dict[Tuple[str, str], List[Tuple[str, str]]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        t = self.type_of.get
+        rank = _TYPE_RANK.get
+        by_type: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for a, b in self.adj:
+            ta, tb = t(a), t(b)
+            if rank(tb, _UNRANKED) < rank(ta, _UNRANKED):
+                a, b, ta, tb = b, a, tb, ta
+            key = (ta, tb)
+            bucket = by_type.get(key)
+            if bucket is None:
+                bucket = by_type[key] = []
+            bucket.append((a, b))
+        self.adj_by_type = by_type
+
+        by_type = {}
+        for x, y in dict.fromkeys(self.above_pairs):
+            key = (t(x), t(y))
+            bucket = by_type.get(key)
+            if bucket is None:
+                bucket = by_type[key] = []
+            bucket.append((x, y))
+        self.above_by_type = by_type
+
+    @classmethod
+    def from_factbase(cls, fb: "FactBase") -> "FactIndex":
+        """
+        Build the index from fb.columns: only the four indexed predicates are
+        visited, not every fact (derived requires_before / supports included).
+        """
+        return cls(
+            type_of=dict(fb.pairs("has_type")),
+            storey_of=dict(fb.pairs("in_storey")),
+            # fb's columns are deduplicated and in file order: no set/sort needed
+            adj=tuple(fb.pairs("adjacent")),
+            above_pairs=list(fb.pairs("above")),
+        )
+
+def _json_line(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def append_trace(trace, record: dict) -> None:
+    """
+    Write one compact JSONL record (orjson when installed). trace is either a
+    file opened in binary mode, so a run keeps one buffered handle instead of
+    reopening the file per step, or a path to append to.
+    """
+    line = _json_line(record)
+    if isinstance(trace, str):
+        with open(trace, "ab") as f:
+            f.write(line)
+    else:
+        trace.write(line)
 
 def get_fact(fb: FactBase, subj: str, pred: str, obj: str) -> list:
     """
@@ -1,11 +1,58 @@
-from typing import List, Tuple, Iterable
+from itertools import islice
+from typing import List, Optional, Tuple, Iterable
 import csv
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: read_facts_tsv falls back to the line loop
+    pa = None
+
 Fact = Tuple[str, str, str]  # (subject, predicate, object)
 
+def _read_facts_tsv_arrow(path: str) -> Optional[List[Fact]]:
+    """
+    Parse a well-formed facts file (exactly 3 columns per line) with pyarrow's
+    multi-threaded C reader. Raises pa.ArrowInvalid on ragged/empty files and
+    returns None when a row needs the line loop's skip rules (an empty field
+    after trimming, or a repeated header row), so the caller falls back.
+    """
+    # utf-8-sig: pyarrow drops a leading BOM, so the header check (and the
+    # line loop) must too, or the first subject would differ between paths
+    with open(path, "r", encoding="utf-8-sig") as f:
+        first = f.readline().strip().split("\t")
+    has_header = len(first) >= 3 and first[0] == "subject" and first[1] == "predicate"
+
+    cols = ["s", "p", "o"]
+    tbl = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=cols, skip_rows=1 if has_header else 0),
+        parse_options=pa_csv.ParseOptions(delimiter="\t", quote_char=False),
+        convert_options=pa_csv.ConvertOptions(column_types={c: pa.string() for c in cols}),
+    )
+    s, p, o = (pc.utf8_trim_whitespace(tbl[c]) for c in cols)
+    # The line loop strips the whole line before splitting, so a leading or
+    # trailing empty field shifts or drops the row there; middle ones are kept.
+    # Rather than mirror that here, hand any row with an empty field to it.
+    if any(pc.any(pc.equal(pc.utf8_length(c), 0)).as_py() for c in (s, p, o)):
+        return None
+    if pc.any(pc.and_(pc.equal(s, "subject"), pc.equal(p, "predicate"))).as_py():
+        return None
+    return list(zip(s.to_pylist(), p.to_pylist(), o.to_pylist()))
+
 def read_facts_tsv(path: str) -> List[Fact]:
+    if pa is not None:
+        try:
+            facts = _read_facts_tsv_arrow(path)
+        except pa.ArrowInvalid:
+            facts = None  # empty/ragged file
+        if facts is not None:
+            return facts
+        # otherwise the line loop below applies its skip rules
+
     facts: List[Fact] = []
-    with open(path, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8-sig") as f:
         for line in f:
             line = line.strip()
             if not line:
@@ -20,19 +67,27 @@ def read_facts_tsv(path: str) -> List[Fact]:
             facts.append((s, p, o))
     return facts
 
-def write_facts_tsv(path: str, facts: Iterable[Fact]) -> None:
+def write_facts_tsv(path: str, facts: Iterable[Fact], chunk: int = 8192) -> None:
     with open(path, "w", encoding="utf-8", newline="") as f:
         f.write("subject\tpredicate\tobject\n")
-        for s, p, o in facts:
-            f.write(f"{s}\t{p}\t{o}\n")
+        # one joined write per chunk of rows instead of one write per row
+        it = iter(facts)
+        while True:
+            rows = list(islice(it, chunk))
+            if not rows:
+                break
+            f.write("".join([f"{s}\t{p}\t{o}\n" for s, p, o in rows]))
 
-def write_precedence_csv(path: str, rows: Iterable[dict]) -> None:
+def write_precedence_csv(path: str, rows: Iterable) -> None:
+    """
+    rows are engine.Edge tuples (already in column order) or dicts keyed by
+    the column names.
+    """
     fieldnames = ["src", "dst", "edge_type", "rule_id", "confidence", "evidence"]
     with open(path, "w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
+        w = csv.writer(f)
+        w.writerow(fieldnames)
+        w.writerows(r if isinstance(r, tuple) else [r.get(k, "") for k in fieldnames] for r in rows)
 
 def write_constraints_tsv(path: str, facts: Iterable[Fact]) -> None:
     # same format as facts.tsv
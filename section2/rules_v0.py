@@ -1,273 +1,124 @@
-from typing import Dict, List, Tuple, Set
-from section2.engine import FactBase
-
-Fact = Tuple[str, str, str]
-
-def type_of(facts: List[Fact]) -> Dict[str, str]:
-    t = {}
-    for s, p, o in facts:
-        if p == "has_type":
-            t[s] = o
-    return t
-
-def storey_of(facts: List[Fact]) -> Dict[str, str]:
-    st = {}
-    for s, p, o in facts:
-        if p == "in_storey":
-            st[s] = o
-    return st
-
-def build_adj_set(facts: List[Fact]) -> Set[Tuple[str, str]]:
-    return set((s, o) for s, p, o in facts if p == "adjacent")
-
-def build_above_pairs(facts: List[Fact]) -> List[Tuple[str, str]]:
-    # returns (x, y) for x above y
-    return [(s, o) for s, p, o in facts if p == "above"]
+from section2.engine import Edge, FactIndex
 
 # ---- RULES ----
 
-def rule_slab_before_above(facts: List[Fact]):
+# Type-pair keys into idx.adj_by_type / idx.above_by_type: each rule reads
+# only the buckets it matches instead of filtering every pair.
+
+# R1: (type(x), type(y)) for x above a slab y. The destination types filter
+# out noisy precedence (slab->slab, slab->railing).
+_R1_ALLOWED_DST = (
+    "IfcWall", "IfcWallStandardCase",
+    "IfcColumn", "IfcBeam", "IfcMember",
+    "IfcStair",
+    # "IfcDoor", "IfcWindow",  # bật nếu bạn muốn slab->opening
+)
+_R1_ABOVE_SLAB = tuple((tx, "IfcSlab") for tx in _R1_ALLOWED_DST)
+_WALL_TYPES = ("IfcWall", "IfcWallStandardCase")
+
+# Adjacency keys are (earlier, later): idx.adj_by_type orients every pair by
+# build order, so each bucket already holds the (src, dst) pairs to emit.
+_R2_WALL_DOOR = (("IfcWall", "IfcDoor"), ("IfcWallStandardCase", "IfcDoor"))
+_R3_BEAM_MEMBER = (("IfcBeam", "IfcMember"),)
+_R5_COLUMN_BEAM = (("IfcColumn", "IfcBeam"),)
+_R6_BEAM_SLAB = (("IfcBeam", "IfcSlab"),)
+_R7_SLAB_WALL = tuple(("IfcSlab", tw) for tw in _WALL_TYPES)
+
+# Above keys are (type(x), type(y)) for x above y.
+_R6_SLAB_ABOVE_BEAM = (("IfcSlab", "IfcBeam"),)
+_R7_WALL_ABOVE_SLAB = tuple((tw, "IfcSlab") for tw in _WALL_TYPES)
+
+def _typed_pairs(by_type, keys, st=None):
+    """
+    Yield the pairs in by_type's buckets for keys; with st (storey_of), skip
+    pairs on different storeys when both storeys are known.
+    """
+    for key in keys:
+        for a, b in by_type.get(key, ()):
+            # same storey if available (avoid cross-storey noise)
+            if st is not None and a in st and b in st and st[a] != st[b]:
+                continue
+            yield a, b
+
+def rule_slab_before_above(idx: FactIndex):
     """
     If x above y AND y is IfcSlab -> y must be before x.
     Filter dst types to avoid noisy precedence (e.g., slab->slab, slab->railing).
     """
-    t = type_of(facts)
-
-    allowed_dst = {
-        "IfcWall", "IfcWallStandardCase",
-        "IfcColumn", "IfcBeam", "IfcMember",
-        "IfcStair",
-        # "IfcDoor", "IfcWindow",  # bật nếu bạn muốn slab->opening
-    }
-
     outs = []
-    for x, y in build_above_pairs(facts):
+    for x, y in _typed_pairs(idx.above_by_type, _R1_ABOVE_SLAB):
         # x above y
-        if t.get(y) != "IfcSlab":
-            continue
-        if t.get(x) not in allowed_dst:
-            continue
-
-        outs.append({
-            "src": y, "dst": x,
-            "edge_type": "requires_before",
-            "rule_id": "R1_SLAB_BEFORE_ABOVE",
-            "confidence": 0.75,
-            "evidence": "above|has_type"
-        })
+        outs.append(Edge(y, x, "requires_before", "R1_SLAB_BEFORE_ABOVE", 0.75, "above|has_type"))
     return outs
 
-def rule_wall_before_door(facts: List[Fact]):
+def rule_wall_before_door(idx: FactIndex):
     """
     If door adjacent wall -> wall before door
     """
-    t = type_of(facts)
-    st = storey_of(facts)
-    adj = build_adj_set(facts)
-
     outs = []
-    for a, b in adj:
-        ta, tb = t.get(a), t.get(b)
-        if ta is None or tb is None:
-            continue
-        # wall-standardcase or wall
-        is_wall_a = ta in ("IfcWall", "IfcWallStandardCase")
-        is_wall_b = tb in ("IfcWall", "IfcWallStandardCase")
-        is_door_a = ta == "IfcDoor"
-        is_door_b = tb == "IfcDoor"
-
-        # same storey if available (avoid cross-storey adjacency noise)
-        if a in st and b in st and st[a] != st[b]:
-            continue
-
-        if is_wall_a and is_door_b:
-            outs.append({
-                "src": a, "dst": b,
-                "edge_type": "requires_before",
-                "rule_id": "R2_WALL_BEFORE_DOOR",
-                "confidence": 0.85,
-                "evidence": "adjacent|has_type|in_storey"
-            })
-        if is_wall_b and is_door_a:
-            outs.append({
-                "src": b, "dst": a,
-                "edge_type": "requires_before",
-                "rule_id": "R2_WALL_BEFORE_DOOR",
-                "confidence": 0.85,
-                "evidence": "adjacent|has_type|in_storey"
-            })
+    for src, dst in _typed_pairs(idx.adj_by_type, _R2_WALL_DOOR, idx.storey_of):
+        outs.append(Edge(src, dst, "requires_before", "R2_WALL_BEFORE_DOOR", 0.85, "adjacent|has_type|in_storey"))
     return outs
 
-def rule_beam_before_member(facts: List[Fact]):
+def rule_beam_before_member(idx: FactIndex):
     """
     Roof/member (IfcMember) often depends on beams/purlins.
     If member adjacent beam -> beam before member.
     """
-    t = type_of(facts)
-    st = storey_of(facts)
-    adj = build_adj_set(facts)
-
     outs = []
-    for a, b in adj:
-        ta, tb = t.get(a), t.get(b)
-        if ta is None or tb is None:
-            continue
-        if a in st and b in st and st[a] != st[b]:
-            continue
-
-        if ta == "IfcBeam" and tb == "IfcMember":
-            outs.append({
-                "src": a, "dst": b,
-                "edge_type": "requires_before",
-                "rule_id": "R3_BEAM_BEFORE_MEMBER",
-                "confidence": 0.70,
-                "evidence": "adjacent|has_type|in_storey"
-            })
-        if tb == "IfcBeam" and ta == "IfcMember":
-            outs.append({
-                "src": b, "dst": a,
-                "edge_type": "requires_before",
-                "rule_id": "R3_BEAM_BEFORE_MEMBER",
-                "confidence": 0.70,
-                "evidence": "adjacent|has_type|in_storey"
-            })
+    for src, dst in _typed_pairs(idx.adj_by_type, _R3_BEAM_MEMBER, idx.storey_of):
+        outs.append(Edge(src, dst, "requires_before", "R3_BEAM_BEFORE_MEMBER", 0.70, "adjacent|has_type|in_storey"))
     return outs
 
-def rule_supports_from_above(facts: List[Fact]):
+def rule_supports_from_above(idx: FactIndex):
     """
     If x above y -> y supports x (symbolic fact)
     """
-    new_facts = []
-    for x, y in build_above_pairs(facts):
-        new_facts.append((y, "supports", x))
-    return new_facts
+    return [(y, "supports", x) for x, y in idx.above_pairs]
 
-def rule_column_before_beam(facts: List[Fact]):
+def rule_column_before_beam(idx: FactIndex):
     """
     Column -> Beam if same storey and adjacent.
     """
-    t = type_of(facts)
-    st = storey_of(facts)
-    adj = build_adj_set(facts)
-
     outs = []
-    for a, b in adj:
-        if a in st and b in st and st[a] != st[b]:
-            continue
-
-        if t.get(a) == "IfcColumn" and t.get(b) == "IfcBeam":
-            outs.append({
-                "src": a, "dst": b,
-                "edge_type": "requires_before",
-                "rule_id": "R5_COLUMN_BEFORE_BEAM",
-                "confidence": 0.72,
-                "evidence": "adjacent|has_type|in_storey"
-            })
-        if t.get(b) == "IfcColumn" and t.get(a) == "IfcBeam":
-            outs.append({
-                "src": b, "dst": a,
-                "edge_type": "requires_before",
-                "rule_id": "R5_COLUMN_BEFORE_BEAM",
-                "confidence": 0.72,
-                "evidence": "adjacent|has_type|in_storey"
-            })
+    for src, dst in _typed_pairs(idx.adj_by_type, _R5_COLUMN_BEAM, idx.storey_of):
+        outs.append(Edge(src, dst, "requires_before", "R5_COLUMN_BEFORE_BEAM", 0.72, "adjacent|has_type|in_storey"))
     return outs
 
-def rule_beam_before_slab(facts: List[Fact]):
+def rule_beam_before_slab(idx: FactIndex):
     """
     Beam -> Slab if same storey and (adjacent OR slab above beam).
     This avoids edge explosion.
     """
-    t = type_of(facts)
-    st = storey_of(facts)
-    adj = build_adj_set(facts)
-    above = set(build_above_pairs(facts))  # (x above y)
+    st = idx.storey_of
 
     outs = []
 
     # Adjacent-based
-    for a, b in adj:
-        if a in st and b in st and st[a] != st[b]:
-            continue
-
-        if t.get(a) == "IfcBeam" and t.get(b) == "IfcSlab":
-            outs.append({
-                "src": a, "dst": b,
-                "edge_type": "requires_before",
-                "rule_id": "R6_BEAM_BEFORE_SLAB",
-                "confidence": 0.70,
-                "evidence": "adjacent|has_type|in_storey"
-            })
-        if t.get(b) == "IfcBeam" and t.get(a) == "IfcSlab":
-            outs.append({
-                "src": b, "dst": a,
-                "edge_type": "requires_before",
-                "rule_id": "R6_BEAM_BEFORE_SLAB",
-                "confidence": 0.70,
-                "evidence": "adjacent|has_type|in_storey"
-            })
+    for src, dst in _typed_pairs(idx.adj_by_type, _R6_BEAM_SLAB, st):
+        outs.append(Edge(src, dst, "requires_before", "R6_BEAM_BEFORE_SLAB", 0.70, "adjacent|has_type|in_storey"))
 
     # Above-based (slab above beam -> beam before slab)
     # If slab (x) above beam (y): above(x,y) where x=slab, y=beam
-    for x, y in above:
-        if t.get(x) == "IfcSlab" and t.get(y) == "IfcBeam":
-            if x in st and y in st and st[x] != st[y]:
-                continue
-            outs.append({
-                "src": y, "dst": x,
-                "edge_type": "requires_before",
-                "rule_id": "R6_BEAM_BEFORE_SLAB",
-                "confidence": 0.74,
-                "evidence": "above|has_type|in_storey"
-            })
+    for x, y in _typed_pairs(idx.above_by_type, _R6_SLAB_ABOVE_BEAM, st):
+        outs.append(Edge(y, x, "requires_before", "R6_BEAM_BEFORE_SLAB", 0.74, "above|has_type|in_storey"))
 
     return outs
 
-def rule_slab_before_wall(facts: List[Fact]):
+def rule_slab_before_wall(idx: FactIndex):
     """Slab -> Wall if same storey and wall is above slab OR adjacent.
     Prefer above evidence (stronger), fallback adjacent."""
-    t = type_of(facts)
-    st = storey_of(facts)
-    adj = build_adj_set(facts)
-    above = set(build_above_pairs(facts))  # (x above y)
+    st = idx.storey_of
 
     outs = []
 
     # above-based: wall above slab -> slab before wall
-    for x, y in above:
+    for x, y in _typed_pairs(idx.above_by_type, _R7_WALL_ABOVE_SLAB, st):
         # x above y
-        if t.get(x) in ("IfcWall", "IfcWallStandardCase") and t.get(y) == "IfcSlab":
-            if x in st and y in st and st[x] != st[y]:
-                continue
-            outs.append({
-                "src": y, "dst": x,
-                "edge_type": "requires_before",
-                "rule_id": "R7_SLAB_BEFORE_WALL",
-                "confidence": 0.80,
-                "evidence": "above|has_type|in_storey"
-            })
+        outs.append(Edge(y, x, "requires_before", "R7_SLAB_BEFORE_WALL", 0.80, "above|has_type|in_storey"))
 
     # adjacency-based fallback (weaker)
-    for a, b in adj:
-        if a in st and b in st and st[a] != st[b]:
-            continue
-
-        if t.get(a) == "IfcSlab" and t.get(b) in ("IfcWall", "IfcWallStandardCase"):
-            outs.append({
-                "src": a, "dst": b,
-                "edge_type": "requires_before",
-                "rule_id": "R7_SLAB_BEFORE_WALL",
-                "confidence": 0.65,
-                "evidence": "adjacent|has_type|in_storey"
-            })
-        if t.get(b) == "IfcSlab" and t.get(a) in ("IfcWall", "IfcWallStandardCase"):
-            outs.append({
-                "src": b, "dst": a,
-                "edge_type": "requires_before",
-                "rule_id": "R7_SLAB_BEFORE_WALL",
-                "confidence": 0.65,
-                "evidence": "adjacent|has_type|in_storey"
-            })
+    for src, dst in _typed_pairs(idx.adj_by_type, _R7_SLAB_WALL, st):
+        outs.append(Edge(src, dst, "requires_before", "R7_SLAB_BEFORE_WALL", 0.65, "adjacent|has_type|in_storey"))
 
     return outs
-
@@ -7,8 +7,71 @@ from section2.io_utils import (
 )
 
 from section2 import rules_v0
-from section2.engine import FactBase, append_trace, get_fact
-
+from section2.engine import Edge, FactBase, FactIndex, append_trace, get_fact
+
+
+def _keep_best(best: dict, row: Edge) -> bool:
+    """
+    Keep row if it beats the best confidence so far for its
+    (src, dst, edge_type); self-loops are never kept.
+    """
+    if row.src == row.dst:
+        return False
+    key = (row.src, row.dst, row.edge_type)
+    cur = best.get(key)
+    if cur is not None and row.confidence <= cur.confidence:
+        return False
+    best[key] = row
+    return True
+
+
+def _apply_rows(fb: FactBase, best: dict, derived_new: list, rows):
+    """
+    Record one rule's rows: keep those that beat the best confidence so far
+    (rows that don't improve on an existing edge are not re-emitted), add
+    their requires_before facts to fb and derived_new. Returns the kept rows,
+    their facts (row-aligned) and the set of facts that were actually new.
+
+    A row that only raises an edge's confidence is still traced, but its
+    requires_before fact is reported as new once, when first derived (see
+    _report_new).
+    """
+    rows = [row for row in rows if _keep_best(best, row)]
+    rb_facts = [(row.src, "requires_before", row.dst) for row in rows]
+    new_rb = fb.add_many(rb_facts)
+    derived_new.extend(new_rb)
+    return rows, rb_facts, set(new_rb)
+
+
+def _report_new(new_facts: set, fact) -> list:
+    """
+    [fact] the first time a just-added fact is reported, [] after that: a rule
+    can emit the same edge twice in one batch (R6 adjacent, then the stronger
+    above row), and only the first trace record derived the fact.
+    """
+    if fact in new_facts:
+        new_facts.discard(fact)
+        return [list(fact)]
+    return []
+
+
+def _collect_evidence(fb: FactBase, src: str, dst: str, probes) -> list:
+    """
+    Trace evidence for one rule firing: every probe (s, p, o) that holds in fb,
+    then the in_storey facts of src and dst. A probe given as a tuple of
+    alternatives contributes only the first alternative that holds.
+    """
+    facts = fb.facts
+    evidence = []
+    for probe in probes:
+        for fact in (probe if isinstance(probe[0], tuple) else (probe,)):
+            if fact in facts:
+                evidence.append(list(fact))
+                break
+    evidence += fb.get_by_subject("in_storey", src)
+    if dst != src:
+        evidence += fb.get_by_subject("in_storey", dst)
+    return evidence
 
 def main(sec1_dir: str, sec2_dir: str):
     os.makedirs(sec2_dir, exist_ok=True)
@@ -22,272 +85,220 @@ def main(sec1_dir: str, sec2_dir: str):
     trace_path = os.path.join(sec2_dir, "trace.jsonl")
     constraints_path = os.path.join(sec2_dir, "constraints.tsv")
 
-    # reset trace
-    open(trace_path, "w", encoding="utf-8").close()
-
-    base_facts = read_facts_tsv(facts_in)
+    fb = FactBase(read_facts_tsv(facts_in))
 
     # v0: enrichment optional, if file exists -> load it
-    all_facts = list(base_facts)
     if os.path.exists(enriched_path):
         try:
             enriched = read_facts_tsv(enriched_path)
-            all_facts.extend(enriched)
         except Exception:
-            pass
-
-    fb = FactBase(all_facts)
-
-    # --- apply rules once (v0). later you can do fixpoint chaining.
-    precedence_rows = []
+            enriched = []
+        fb.add_many(enriched)
+
+    # --- apply rules once (v0).
+    # A single pass is a fixpoint here: the rules only read has_type /
+    # in_storey / adjacent / above, never the requires_before / supports facts
+    # they derive. If a rule ever chains on derived facts, bring back the
+    # iteration loop and re-run just those rules until nothing new is added.
+    precedence_best = {}  # (src, dst, edge_type) -> highest-confidence row
     derived_new = []
     constraints = []
-    new_facts_added = True
-    max_iters = 5
-    iter_no = 0
+    constraints_seen = set()
+    iter_no = 1
 
     step = 0
 
-    while new_facts_added and iter_no < max_iters:
-        iter_no += 1
-        new_facts_added = False
-
-        current_facts = list(fb.facts)
+    # one buffered handle for the whole run (truncates any previous trace)
+    with open(trace_path, "wb", buffering=1 << 16) as trace_fh:
+        # rules only add requires_before / supports, which the index ignores,
+        # so one index serves every rule
+        idx = FactIndex.from_factbase(fb)
+        # a rule can't fire without its input predicates (sparse or partial
+        # exports often lack above / adjacent); skip those rules outright
+        typed = bool(idx.type_of)
+        run_above = typed and bool(idx.above_pairs)
+        run_adj = typed and bool(idx.adj)
 
         # R1: slab -> element above slab  (edge + derived requires_before fact)
-        for row in rules_v0.rule_slab_before_above(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_slab_before_above(idx) if run_above else [])
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
-
-            # also write as derived fact
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
-
-            src = row["src"]  # slab
-            dst = row["dst"]  # element
-            evidence = []
-            evidence += get_fact(fb, dst, "above", src)
-            evidence += get_fact(fb, src, "has_type", "IfcSlab")
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
-
-            append_trace(trace_path, {
+
+            src = row.src  # slab
+            dst = row.dst  # element
+            evidence = _collect_evidence(fb, src, dst, [
+                (dst, "above", src),
+                (src, "has_type", "IfcSlab"),
+            ])
+
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"slab": src, "elem": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
             })
 
-        current_facts = list(fb.facts)
-
         # R2: wall -> door/window (edge + derived requires_before + hard constraint cannot_before)
-        for row in rules_v0.rule_wall_before_door(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_wall_before_door(idx) if run_adj else [])
+        # hard constraint, kept once per (opening, wall)
+        for row in rows:
+            c = (row.dst, "cannot_before", row.src)
+            if c not in constraints_seen:
+                constraints_seen.add(c)
+                constraints.append(c)
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
-
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
-
-            # hard constraint
-            constraints.append((row["dst"], "cannot_before", row["src"]))
-
-            src = row["src"]  # wall
-            dst = row["dst"]  # opening
-            evidence = []
-            evidence += get_fact(fb, src, "adjacent", dst)
-            evidence += get_fact(fb, src, "has_type", "IfcWallStandardCase")
-            if not evidence:
-                evidence += get_fact(fb, src, "has_type", "IfcWall")
-            evidence += get_fact(fb, dst, "has_type", "IfcDoor")
-            if not evidence:
-                evidence += get_fact(fb, dst, "has_type", "IfcWindow")
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
-
-            append_trace(trace_path, {
+
+            src = row.src  # wall
+            dst = row.dst  # opening
+            evidence = _collect_evidence(fb, src, dst, [
+                (src, "adjacent", dst),
+                ((src, "has_type", "IfcWallStandardCase"), (src, "has_type", "IfcWall")),
+                ((dst, "has_type", "IfcDoor"), (dst, "has_type", "IfcWindow")),
+            ])
+
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"wall": src, "opening": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]],
-                            [dst, "cannot_before", src]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
+                            + [[dst, "cannot_before", src]]
             })
 
-        current_facts = list(fb.facts)
-
         # R3: beam -> member (edge + derived requires_before fact)
-        for row in rules_v0.rule_beam_before_member(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_beam_before_member(idx) if run_adj else [])
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
-
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
-
-            src = row["src"]  # beam
-            dst = row["dst"]  # member
-            evidence = []
-            evidence += get_fact(fb, src, "adjacent", dst)
-            evidence += get_fact(fb, src, "has_type", "IfcBeam")
-            evidence += get_fact(fb, dst, "has_type", "IfcMember")
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
-
-            append_trace(trace_path, {
+
+            src = row.src  # beam
+            dst = row.dst  # member
+            evidence = _collect_evidence(fb, src, dst, [
+                (src, "adjacent", dst),
+                (src, "has_type", "IfcBeam"),
+                (dst, "has_type", "IfcMember"),
+            ])
+
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"beam": src, "member": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
             })
 
-        current_facts = list(fb.facts)
-        
         #R5 column -> Beam
-        current_facts = list(fb.facts)
-        for row in rules_v0.rule_column_before_beam(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_column_before_beam(idx) if run_adj else [])
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
-
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
 
-            src = row["src"]  # column
-            dst = row["dst"]  # beam
+            src = row.src  # column
+            dst = row.dst  # beam
 
-            evidence = []
-            evidence += get_fact(fb, src, "adjacent", dst)
-            evidence += get_fact(fb, src, "has_type", "IfcColumn")
-            evidence += get_fact(fb, dst, "has_type", "IfcBeam")
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
+            evidence = _collect_evidence(fb, src, dst, [
+                (src, "adjacent", dst),
+                (src, "has_type", "IfcColumn"),
+                (dst, "has_type", "IfcBeam"),
+            ])
 
-            append_trace(trace_path, {
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"column": src, "beam": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
             })
-            
+
         #R6 Beam -> Slab
-        current_facts = list(fb.facts)
-        for row in rules_v0.rule_beam_before_slab(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_beam_before_slab(idx) if run_above or run_adj else [])
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
 
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
+            src = row.src  # beam
+            dst = row.dst  # slab
 
-            src = row["src"]  # beam
-            dst = row["dst"]  # slab
-
-            evidence = []
             # evidence can come from adjacent OR above depending on how rule fired
-            evidence += get_fact(fb, src, "adjacent", dst)
-            evidence += get_fact(fb, dst, "adjacent", src)
-            evidence += get_fact(fb, dst, "above", src)  # slab above beam case
-            evidence += get_fact(fb, src, "has_type", "IfcBeam")
-            evidence += get_fact(fb, dst, "has_type", "IfcSlab")
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
-
-            append_trace(trace_path, {
+            evidence = _collect_evidence(fb, src, dst, [
+                (src, "adjacent", dst),
+                (dst, "adjacent", src),
+                (dst, "above", src),  # slab above beam case
+                (src, "has_type", "IfcBeam"),
+                (dst, "has_type", "IfcSlab"),
+            ])
+
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"beam": src, "slab": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
             })
-        
+
         #R7
-        current_facts = list(fb.facts)
-        for row in rules_v0.rule_slab_before_wall(current_facts):
+        rows, rb_facts, new_rb = _apply_rows(
+            fb, precedence_best, derived_new,
+            rules_v0.rule_slab_before_wall(idx) if run_above or run_adj else [])
+        for row, rb_fact in zip(rows, rb_facts):
             step += 1
-            precedence_rows.append(row)
-
-            rb_fact = (row["src"], "requires_before", row["dst"])
-            if fb.add(rb_fact):
-                derived_new.append(rb_fact)
-                new_facts_added = True
 
-            src = row["src"]  # slab
-            dst = row["dst"]  # wall
+            src = row.src  # slab
+            dst = row.dst  # wall
 
-            evidence = []
-            evidence += get_fact(fb, dst, "above", src)   # wall above slab
-            evidence += get_fact(fb, src, "adjacent", dst)
-            evidence += get_fact(fb, src, "has_type", "IfcSlab")
-            evidence += get_fact(fb, dst, "has_type", "IfcWallStandardCase")
-            if not evidence:
-                evidence += get_fact(fb, dst, "has_type", "IfcWall")
+            evidence = _collect_evidence(fb, src, dst, [
+                (dst, "above", src),  # wall above slab
+                (src, "adjacent", dst),
+                (src, "has_type", "IfcSlab"),
+                ((dst, "has_type", "IfcWallStandardCase"), (dst, "has_type", "IfcWall")),
+            ])
 
-            for s, p, o in fb.get("in_storey"):
-                if s == src or s == dst:
-                    evidence.append([s, p, o])
-
-            append_trace(trace_path, {
+            append_trace(trace_fh, {
                 "step": step,
                 "iter": iter_no,
-                "rule_id": row["rule_id"],
+                "rule_id": row.rule_id,
                 "bindings": {"slab": src, "wall": dst},
                 "evidence": evidence,
-                "new_edges": [row],
-                "new_facts": [[rb_fact[0], rb_fact[1], rb_fact[2]]]
+                "new_edges": [row._asdict()],
+                "new_facts": _report_new(new_rb, rb_fact)
             })
 
 
         # R4: supports from above (facts)
-        for fact in rules_v0.rule_supports_from_above(current_facts):
-            if fb.add(fact):
-                derived_new.append(fact)
-                new_facts_added = True
-
-                step += 1
-                append_trace(trace_path, {
-                    "step": step,
-                    "iter": iter_no,
-                    "rule_id": "R4_SUPPORTS_FROM_ABOVE",
-                    "bindings": {"support": fact[0], "supported": fact[2]},
-                    "evidence": get_fact(fb, fact[2], "above", fact[0]),
-                    "new_edges": [],
-                    "new_facts": [[fact[0], fact[1], fact[2]]]
-                })
-
-    best = {}
-    for r in precedence_rows:
-        key = (r["src"], r["dst"], r["edge_type"])
-        if key not in best or float(r["confidence"]) > float(best[key]["confidence"]):
-            best[key] = r
-    precedence_rows = list(best.values())
-    precedence_rows = [r for r in precedence_rows if r["src"] != r["dst"]]
-    
+        supports = fb.add_many(rules_v0.rule_supports_from_above(idx)) if idx.above_pairs else []
+        derived_new.extend(supports)
+        for fact in supports:
+            step += 1
+            append_trace(trace_fh, {
+                "step": step,
+                "iter": iter_no,
+                "rule_id": "R4_SUPPORTS_FROM_ABOVE",
+                "bindings": {"support": fact[0], "supported": fact[2]},
+                "evidence": get_fact(fb, fact[2], "above", fact[0]),
+                "new_edges": [],
+                "new_facts": [[fact[0], fact[1], fact[2]]]
+            })
 
+    precedence_rows = list(precedence_best.values())
 
     # write outputs
     write_facts_tsv(derived_path, derived_new)
@@ -300,7 +311,6 @@ def main(sec1_dir: str, sec2_dir: str):
     if not os.path.exists(enriched_path):
         write_facts_tsv(enriched_path, [])
 
-    constraints = list(dict.fromkeys(constraints))
     write_constraints_tsv(constraints_path, constraints)
     print("constraints:", constraints_path)
     print("Section2 done.")